@@ -10,19 +10,25 @@
   python3 tools/analyze_compression.py --top 10 logs/docker.log
   python3 tools/analyze_compression.py --csv output.csv logs/docker.log
   python3 tools/analyze_compression.py --json logs/docker.log
+  python3 tools/analyze_compression.py -j 8 logs/docker.log
   cat logs/docker.log | python3 tools/analyze_compression.py -
 """
 
 from __future__ import annotations
 
 import argparse
+import concurrent.futures
 import csv
 import json
+import mmap
+import os
 import re
+import stat
 import sys
-from collections import defaultdict
-from dataclasses import asdict, dataclass, field
-from typing import Any, Dict, List, Optional, Sequence
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from operator import attrgetter
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Sequence
 
 
 # ---------------------------------------------------------------------------
@@ -34,6 +40,9 @@ ANSI_RE = re.compile(r"\x1b\[[0-9;:?]*[A-Za-z]")
 
 
 def strip_ansi(s: str) -> str:
+    # 无 ESC 字符时直接返回（docker logs 重定向后的常见情况），省掉一次 re.sub
+    if "\x1b" not in s:
+        return s
     return ANSI_RE.sub("", s)
 
 
@@ -47,7 +56,9 @@ TIMESTAMP_RE = re.compile(r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})")
 
 def extract_timestamp(line: str) -> Optional[str]:
     """提取行首 ISO 时间戳，返回秒级精度字符串或 None。"""
-    m = TIMESTAMP_RE.search(line[:40])
+    # 常见情况时间戳就在第 0 列，先做锚定匹配；
+    # 带前缀的行（如 docker compose 的 "service | "）再在前 40 个字符内查找，不切片复制。
+    m = TIMESTAMP_RE.match(line) or TIMESTAMP_RE.search(line, 0, 40)
     return m.group(1) if m else None
 
 
@@ -88,24 +99,99 @@ def kv_float(kv: Dict[str, str], key: str, default: float = 0.0) -> float:
         return default
 
 
+# 数值字段值，语法同 KV_RE 的值部分（与回退路径 parse_kv + kv_int 的取值一致）
+PEEK_VALUE_RE = re.compile(r"\d+(?:\.\d+)?|\"[^\"]*\"|[^\s,]+")
+
+# 字符串字段值：带引号（可含空白）或不带引号两个分组。
+# peek_field 与 field_extractor 的字符串字段共用，过滤条件看到的值与记录中保存的值一致。
+STR_VALUE = r'(?:"([^"]*)"|([^\s,]+))'
+STR_VALUE_RE = re.compile(STR_VALUE)
+
+
+def _str_value(m: re.Match[str]) -> str:
+    """取 STR_VALUE 匹配结果中的字段值（不带引号的写法去掉两端残留的引号，同 parse_kv）。"""
+    quoted, bare = m.group(1), m.group(2)
+    return quoted if quoted is not None else bare.strip('"')
+
+
+def _value_pos(line: str, key: str) -> int:
+    """返回 key= 之后值的起始下标，不存在时返回 -1。"""
+    token = key + "="
+    i = line.find(token)
+    # 跳过作为其他 key 后缀出现的情况（如 xmodel=）
+    while i > 0 and (line[i - 1].isalnum() or line[i - 1] == "_"):
+        i = line.find(token, i + 1)
+    return i + len(token) if i >= 0 else -1
+
+
+def peek_field(line: str, key: str) -> Optional[str]:
+    """
+    只取单个字符串字段的值（一次 find + 一次锚定匹配），不存在时返回 None。
+
+    用于过滤条件的提前判断：不满足时可以跳过整行的完整字段提取。
+    """
+    pos = _value_pos(line, key)
+    if pos < 0:
+        return None
+    m = STR_VALUE_RE.match(line, pos)
+    return _str_value(m) if m else None
+
+
+def peek_int(line: str, key: str, default: int = 0) -> int:
+    pos = _value_pos(line, key)
+    if pos < 0:
+        return default
+    m = PEEK_VALUE_RE.match(line, pos)
+    if not m:
+        return default
+    try:
+        return int(m.group().strip('"'))
+    except ValueError:
+        return default
+
+
+def field_extractor(
+    *keys: str,
+    str_keys: Sequence[str] = (),
+) -> Callable[[str], tuple[Optional[str], ...]]:
+    """
+    为一类 tracing 行生成专用的字段提取函数，按 keys 顺序返回字段值元组。
+
+    快速路径为每个 key 预编译一条 \bkey=VALUE 正则，按日志输出顺序从上一个字段的结尾
+    继续 search，不构造 dict；字段缺失或顺序不同时回退到 parse_kv 全量解析。
+    （不把所有字段用 .*? 拼成一条正则：字段缺失时那种写法会指数级回溯。）
+    数值字段总是返回十进制数字串（缺失或非法时为 "0"），调用方可直接 int()；
+    字符串字段（str_keys）与 KV_RE 一样区分带引号（可含空白）和不带引号两种写法，缺失时为 None。
+    """
+    patterns = [
+        (re.compile(rf"\b{key}=" + (STR_VALUE if key in str_keys else r"(\d+)(?![.\w])")), key in str_keys)
+        for key in keys
+    ]
+
+    def extract(line: str) -> tuple[Optional[str], ...]:
+        values = []
+        pos = 0
+        for pattern, is_str in patterns:
+            m = pattern.search(line, pos)
+            if m is None:
+                kv = parse_kv(line)
+                return tuple(kv.get(k) if k in str_keys else str(kv_int(kv, k)) for k in keys)
+            if is_str:
+                values.append(_str_value(m))
+            else:
+                values.append(m.group(1))
+            pos = m.end()
+        return tuple(values)
+
+    return extract
+
+
 # ---------------------------------------------------------------------------
 # 数据模型
 # ---------------------------------------------------------------------------
 
 
-@dataclass
-class RequestRecord:
-    """一次请求行的数据。"""
-    line_no: int
-    timestamp: Optional[str] = None
-    model: str = ""
-    max_tokens: int = 0
-    stream: bool = True
-    message_count: int = 0
-    estimated_input_tokens: int = 0
-
-
-@dataclass
+@dataclass(slots=True)
 class CompressionRecord:
     """一次压缩统计行的数据。"""
     line_no: int
@@ -120,7 +206,7 @@ class CompressionRecord:
     history_bytes_saved: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class ContextUsageRecord:
     """contextUsageEvent 行的数据。"""
     line_no: int
@@ -128,14 +214,14 @@ class ContextUsageRecord:
     actual_input_tokens: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class RejectionRecord:
     """上游拒绝行的数据。"""
     line_no: int
     kiro_request_body_bytes: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class AdaptiveShrinkRecord:
     """自适应二次压缩触发行的数据。"""
     line_no: int
@@ -148,7 +234,7 @@ class AdaptiveShrinkRecord:
     additional_history_turns_removed: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class LocalRejectRecord:
     """本地超限拒绝行的数据。"""
     line_no: int
@@ -160,9 +246,14 @@ class LocalRejectRecord:
     threshold: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class MergedRequest:
-    """关联后的完整请求记录。"""
+    """
+    关联后的完整请求记录。
+
+    解析请求行时直接创建（只填请求字段），关联阶段再原地补齐压缩统计与上下文使用，
+    避免每个请求先后分配两个对象。
+    """
     line_no: int = 0
     timestamp: Optional[str] = None
     model: str = ""
@@ -198,162 +289,455 @@ MARKER_REJECTION = "上游拒绝请求：输入上下文过长"
 MARKER_ADAPTIVE_SHRINK = "请求体超过阈值，已执行自适应二次压缩"
 MARKER_LOCAL_REJECT = "请求体超过安全阈值，拒绝发送"
 
-# contextUsageEvent 格式：收到 contextUsageEvent: 67.2%, 计算 input_tokens: 12345
-CONTEXT_USAGE_RE = re.compile(
-    r"收到 contextUsageEvent:\s*([\d.]+)%.*?input_tokens:\s*(\d+)"
+MARKERS = (
+    MARKER_REQUEST,
+    MARKER_COMPRESSION,
+    MARKER_CONTEXT_USAGE,
+    MARKER_REJECTION,
+    MARKER_ADAPTIVE_SHRINK,
+    MARKER_LOCAL_REJECT,
 )
 
+# bytes 版本（用于 mmap 扫描）：UTF-8 下标记是固定字节序列，可直接按字节匹配
+MARKERS_BYTES = tuple(m.encode("utf-8") for m in MARKERS)
 
-def parse_log(
-    lines: Sequence[str],
-    *,
-    min_tokens: int = 0,
-    model_pattern: Optional[str] = None,
-) -> tuple[
+# 各标记行的字段提取函数（字段顺序与 handlers.rs 中 tracing 宏的字段顺序一致）
+extract_request_fields = field_extractor(
+    "model", "max_tokens", "stream", "message_count", "estimated_input_tokens",
+    str_keys=("model", "stream"),
+)
+extract_compression_fields = field_extractor(
+    "estimated_input_tokens", "bytes_saved_total", "whitespace_bytes_saved",
+    "thinking_bytes_saved", "tool_result_bytes_saved", "tool_use_input_bytes_saved",
+    "history_turns_removed", "history_bytes_saved",
+)
+extract_rejection_fields = field_extractor("kiro_request_body_bytes")
+extract_adaptive_shrink_fields = field_extractor(
+    "conversation_id", "initial_bytes", "final_bytes", "threshold", "iters",
+    "additional_history_turns_removed",
+    str_keys=("conversation_id",),
+)
+extract_local_reject_fields = field_extractor(
+    "conversation_id", "request_body_bytes", "image_bytes", "effective_bytes", "threshold",
+    str_keys=("conversation_id",),
+)
+
+# contextUsageEvent 格式：收到 contextUsageEvent: 67.2%, 计算 input_tokens: 12345
+# 拆成两段锚定匹配：百分比紧跟在标记之后，token 数紧跟在 "input_tokens:" 之后，
+# 中间用 str.find 定位，避免在整行上做带 .*? 的回溯搜索。
+CONTEXT_USAGE_PCT_RE = re.compile(r":\s*([\d.]+)%")
+CONTEXT_USAGE_TOKENS_KEY = "input_tokens:"
+CONTEXT_USAGE_TOKENS_RE = re.compile(r"\s*(\d+)")
+
+
+ParseResult = tuple[
     list[MergedRequest],
     list[RejectionRecord],
     list[AdaptiveShrinkRecord],
     list[LocalRejectRecord],
     int,
-]:
+]
+
+
+class _RecordCollector:
+    """按标记分派候选行并收集各类记录（文本 / bytes 两种扫描方式共用）。"""
+
+    def __init__(self, *, min_tokens: int, model_pattern: Optional[str]) -> None:
+        self.min_tokens = min_tokens
+        self.model_re = re.compile(model_pattern, re.IGNORECASE) if model_pattern else None
+        self.requests: list[MergedRequest] = []
+        self.compressions: list[CompressionRecord] = []
+        self.context_usages: list[ContextUsageRecord] = []
+        self.rejections: list[RejectionRecord] = []
+        self.adaptive_shrinks: list[AdaptiveShrinkRecord] = []
+        self.local_rejects: list[LocalRejectRecord] = []
+        self.handlers = {
+            MARKER_REQUEST: self.on_request,
+            MARKER_COMPRESSION: self.on_compression,
+            MARKER_CONTEXT_USAGE: self.on_context_usage,
+            MARKER_REJECTION: self.on_rejection,
+            MARKER_ADAPTIVE_SHRINK: self.on_adaptive_shrink,
+            MARKER_LOCAL_REJECT: self.on_local_reject,
+        }
+
+    def feed(self, marker: str, line: str, line_no: int) -> None:
+        """处理一条命中 marker 的行（line 可以仍带 ANSI 序列）。"""
+        self.handlers[marker](strip_ansi(line), line_no)
+
+    def _below_min_tokens(self, line: str) -> bool:
+        """谓词下推：只取 estimated_input_tokens 判断 --min-tokens。"""
+        return peek_int(line, "estimated_input_tokens") < self.min_tokens
+
+    def on_request(self, line: str, line_no: int) -> None:
+        # 有过滤条件时先只取过滤字段判断，被过滤的行不做完整字段提取
+        if self.min_tokens and self._below_min_tokens(line):
+            return
+        if self.model_re and not self.model_re.search(peek_field(line, "model") or ""):
+            return
+        model, max_tokens, stream, message_count, est = extract_request_fields(line)
+        self.requests.append(MergedRequest(
+            line_no=line_no,
+            timestamp=extract_timestamp(line),
+            model=model or "",
+            max_tokens=int(max_tokens),
+            stream=stream is None or stream == "true",
+            message_count=int(message_count),
+            estimated_input_tokens=int(est),
+        ))
+
+    def on_compression(self, line: str, line_no: int) -> None:
+        if self.min_tokens and self._below_min_tokens(line):
+            return
+        est, total, ws, th, tr, tu, turns, hist = map(int, extract_compression_fields(line))
+        self.compressions.append(CompressionRecord(
+            line_no=line_no,
+            timestamp=extract_timestamp(line),
+            estimated_input_tokens=est,
+            bytes_saved_total=total,
+            whitespace_bytes_saved=ws,
+            thinking_bytes_saved=th,
+            tool_result_bytes_saved=tr,
+            tool_use_input_bytes_saved=tu,
+            history_turns_removed=turns,
+            history_bytes_saved=hist,
+        ))
+
+    def on_context_usage(self, line: str, line_no: int) -> None:
+        pos = line.find(MARKER_CONTEXT_USAGE)
+        pct = CONTEXT_USAGE_PCT_RE.match(line, pos + len(MARKER_CONTEXT_USAGE))
+        if not pct:
+            return
+        pos = line.find(CONTEXT_USAGE_TOKENS_KEY, pct.end())
+        if pos < 0:
+            return
+        tokens = CONTEXT_USAGE_TOKENS_RE.match(line, pos + len(CONTEXT_USAGE_TOKENS_KEY))
+        if not tokens:
+            return
+        self.context_usages.append(ContextUsageRecord(
+            line_no=line_no,
+            context_usage_percentage=float(pct.group(1)),
+            actual_input_tokens=int(tokens.group(1)),
+        ))
+
+    def on_rejection(self, line: str, line_no: int) -> None:
+        (body_bytes,) = extract_rejection_fields(line)
+        self.rejections.append(RejectionRecord(
+            line_no=line_no,
+            kiro_request_body_bytes=int(body_bytes),
+        ))
+
+    def on_adaptive_shrink(self, line: str, line_no: int) -> None:
+        cid, initial, final, threshold, iters, turns = extract_adaptive_shrink_fields(line)
+        self.adaptive_shrinks.append(AdaptiveShrinkRecord(
+            line_no=line_no,
+            timestamp=extract_timestamp(line),
+            conversation_id=cid,
+            initial_bytes=int(initial),
+            final_bytes=int(final),
+            threshold=int(threshold),
+            iters=int(iters),
+            additional_history_turns_removed=int(turns),
+        ))
+
+    def on_local_reject(self, line: str, line_no: int) -> None:
+        cid, body, image, effective, threshold = extract_local_reject_fields(line)
+        self.local_rejects.append(LocalRejectRecord(
+            line_no=line_no,
+            timestamp=extract_timestamp(line),
+            conversation_id=cid,
+            request_body_bytes=int(body),
+            image_bytes=int(image),
+            effective_bytes=int(effective),
+            threshold=int(threshold),
+        ))
+
+    def records(self) -> tuple[list[Any], ...]:
+        """尚未关联的原始记录（顺序与 extend 的参数一致）。"""
+        return (
+            self.requests,
+            self.compressions,
+            self.context_usages,
+            self.rejections,
+            self.adaptive_shrinks,
+            self.local_rejects,
+        )
+
+    def extend(self, records: tuple[list[Any], ...], line_offset: int) -> None:
+        """并入另一个分片的 records()，并把其相对行号加上 line_offset。"""
+        for mine, theirs in zip(self.records(), records):
+            for r in theirs:
+                r.line_no += line_offset
+            mine.extend(theirs)
+
+    def result(self, total_lines: int) -> ParseResult:
+        # --- 关联请求行与压缩统计行 ---
+        merged = _merge_records(self.requests, self.compressions, self.context_usages)
+        return merged, self.rejections, self.adaptive_shrinks, self.local_rejects, total_lines
+
+
+# 单进程扫描时每个窗口的字节数（对齐到行尾）：命中列表只在窗口内收集排序，
+# 内存占用与窗口内的标记数成正比，而不是整个文件
+SCAN_WINDOW_BYTES = 4 * 1024 * 1024
+
+
+def _find_markers(
+    buf: bytes | mmap.mmap,
+    start: int,
+    end: int,
+) -> list[tuple[int, int]]:
+    """
+    查找 buf[start:end] 中所有标记，返回按位置排序的 (起始偏移, 结束偏移)。
+
+    每个标记单独用 find 扫一遍再合并：find 走 C 层的快速子串搜索，
+    实测六次 find 比一次多分支正则 finditer 快约 3 倍（后者需在每个候选位置逐个尝试分支）。
+    """
+    hits: list[tuple[int, int]] = []
+    for needle in MARKERS_BYTES:
+        i = buf.find(needle, start, end)
+        while i >= 0:
+            j = i + len(needle)
+            hits.append((i, j))
+            i = buf.find(needle, j, end)
+    hits.sort()
+    return hits
+
+
+# 统计换行时每次切片的字节数：mmap 没有带范围参数的 count，只能切片后计数，
+# 按窗口切片可让临时副本大小固定，不随两次命中之间的间隔增长
+COUNT_WINDOW_BYTES = 1024 * 1024
+
+
+def _count_newlines(buf: bytes | mmap.mmap, start: int, end: int) -> int:
+    """统计 buf[start:end] 中的换行符数量，临时内存不超过 COUNT_WINDOW_BYTES。"""
+    n = 0
+    for i in range(start, end, COUNT_WINDOW_BYTES):
+        n += buf[i:min(i + COUNT_WINDOW_BYTES, end)].count(b"\n")
+    return n
+
+
+def _scan_buffer(
+    buf: bytes | mmap.mmap,
+    collector: _RecordCollector,
+    start: int = 0,
+    end: Optional[int] = None,
+    *,
+    first_line: int = 1,
+) -> int:
+    """
+    扫描 buf[start:end]（start 须位于行首），返回该范围内的换行符数量。
+
+    按 SCAN_WINDOW_BYTES 分窗口（窗口边界对齐到行尾）用 _find_markers 查找标记，
+    只有命中的行才切出来解码，并按 MARKERS 顺序判定标记类型（一行含多个标记时取靠前者）；
+    行号（start 所在行为 first_line）由两次命中之间的换行符数量累加得到，
+    不为普通行构造任何 Python 对象。
+    """
+    if end is None:
+        end = len(buf)
+
+    line_no = first_line
+    counted = start  # buf[start:counted] 中的换行已计入 line_no
+    line_end = start  # 上一条已处理行的行尾；同一行内的后续命中直接跳过
+    win_start = start
+    while win_start < end:
+        win_end = win_start + SCAN_WINDOW_BYTES
+        if win_end < end:
+            nl = buf.find(b"\n", win_end - 1, end)
+            win_end = nl + 1 if nl >= 0 else end
+        else:
+            win_end = end
+
+        for hit_start, hit_end in _find_markers(buf, win_start, win_end):
+            if hit_start < line_end:
+                continue
+            line_start = max(buf.rfind(b"\n", win_start, hit_start) + 1, win_start)
+            line_end = buf.find(b"\n", hit_end, win_end)
+            if line_end < 0:
+                line_end = win_end
+            line_no += _count_newlines(buf, counted, line_start)
+            counted = line_start
+            line = buf[line_start:line_end].decode("utf-8", errors="replace")
+            # 一行可能同时包含多个标记，按 MARKERS 优先级取第一个
+            for marker in MARKERS:
+                if marker in line:
+                    collector.feed(marker, line, line_no)
+                    break
+
+        win_start = win_end
+
+    return line_no - first_line + _count_newlines(buf, counted, end)
+
+
+def parse_log_buffer(
+    buf: bytes | mmap.mmap,
+    *,
+    min_tokens: int = 0,
+    model_pattern: Optional[str] = None,
+) -> ParseResult:
     """
-    解析日志行，返回 (merged_requests, rejections, total_lines)。
+    bytes 模式解析整块日志（通常是 mmap 映射的文件），
+    返回 (merged_requests, rejections, adaptive_shrinks, local_rejects, total_lines)。
 
     关联策略：连续出现的请求行和压缩统计行，
     基于 estimated_input_tokens 匹配 + 行号邻近（间距 ≤ 50 行）。
     """
-    requests: list[RequestRecord] = []
-    compressions: list[CompressionRecord] = []
-    context_usages: list[ContextUsageRecord] = []
-    rejections: list[RejectionRecord] = []
-    adaptive_shrinks: list[AdaptiveShrinkRecord] = []
-    local_rejects: list[LocalRejectRecord] = []
-
-    model_re = re.compile(model_pattern, re.IGNORECASE) if model_pattern else None
-
-    for idx, raw_line in enumerate(lines):
-        line_no = idx + 1
-        line = strip_ansi(raw_line)
-
-        if MARKER_REQUEST in line:
-            kv = parse_kv(line)
-            model = kv.get("model", "")
-            if model_re and not model_re.search(model):
-                continue
-            est = kv_int(kv, "estimated_input_tokens")
-            if est < min_tokens:
-                continue
-            requests.append(RequestRecord(
-                line_no=line_no,
-                timestamp=extract_timestamp(line),
-                model=model,
-                max_tokens=kv_int(kv, "max_tokens"),
-                stream=kv.get("stream", "true") == "true",
-                message_count=kv_int(kv, "message_count"),
-                estimated_input_tokens=est,
-            ))
-
-        elif MARKER_COMPRESSION in line:
-            kv = parse_kv(line)
-            est = kv_int(kv, "estimated_input_tokens")
-            if est < min_tokens:
-                continue
-            compressions.append(CompressionRecord(
-                line_no=line_no,
-                timestamp=extract_timestamp(line),
-                estimated_input_tokens=est,
-                bytes_saved_total=kv_int(kv, "bytes_saved_total"),
-                whitespace_bytes_saved=kv_int(kv, "whitespace_bytes_saved"),
-                thinking_bytes_saved=kv_int(kv, "thinking_bytes_saved"),
-                tool_result_bytes_saved=kv_int(kv, "tool_result_bytes_saved"),
-                tool_use_input_bytes_saved=kv_int(kv, "tool_use_input_bytes_saved"),
-                history_turns_removed=kv_int(kv, "history_turns_removed"),
-                history_bytes_saved=kv_int(kv, "history_bytes_saved"),
-            ))
-
-        elif MARKER_CONTEXT_USAGE in line:
-            m = CONTEXT_USAGE_RE.search(line)
-            if m:
-                context_usages.append(ContextUsageRecord(
-                    line_no=line_no,
-                    context_usage_percentage=float(m.group(1)),
-                    actual_input_tokens=int(m.group(2)),
-                ))
-
-        elif MARKER_REJECTION in line:
-            kv = parse_kv(line)
-            rejections.append(RejectionRecord(
-                line_no=line_no,
-                kiro_request_body_bytes=kv_int(kv, "kiro_request_body_bytes"),
-            ))
-
-        elif MARKER_ADAPTIVE_SHRINK in line:
-            kv = parse_kv(line)
-            adaptive_shrinks.append(AdaptiveShrinkRecord(
-                line_no=line_no,
-                timestamp=extract_timestamp(line),
-                conversation_id=kv.get("conversation_id"),
-                initial_bytes=kv_int(kv, "initial_bytes"),
-                final_bytes=kv_int(kv, "final_bytes"),
-                threshold=kv_int(kv, "threshold"),
-                iters=kv_int(kv, "iters"),
-                additional_history_turns_removed=kv_int(kv, "additional_history_turns_removed"),
-            ))
-
-        elif MARKER_LOCAL_REJECT in line:
-            kv = parse_kv(line)
-            local_rejects.append(LocalRejectRecord(
-                line_no=line_no,
-                timestamp=extract_timestamp(line),
-                conversation_id=kv.get("conversation_id"),
-                request_body_bytes=kv_int(kv, "request_body_bytes"),
-                image_bytes=kv_int(kv, "image_bytes"),
-                effective_bytes=kv_int(kv, "effective_bytes"),
-                threshold=kv_int(kv, "threshold"),
-            ))
-
-    # --- 关联请求行与压缩统计行 ---
-    merged = _merge_records(requests, compressions, context_usages)
-
-    return merged, rejections, adaptive_shrinks, local_rejects, len(lines)
+    collector = _RecordCollector(min_tokens=min_tokens, model_pattern=model_pattern)
+    total_lines = _scan_buffer(buf, collector)
+    if len(buf) > 0 and buf[-1:] != b"\n":
+        total_lines += 1
+    return collector.result(total_lines)
+
+
+# 流式读取时每次 read 的块大小
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+def parse_log_stream(
+    stream: BinaryIO,
+    *,
+    min_tokens: int = 0,
+    model_pattern: Optional[str] = None,
+) -> ParseResult:
+    """
+    按块读取二进制流（如 sys.stdin.buffer）并解析，结果与 parse_log_buffer 一致。
+
+    每次读入 READ_CHUNK_BYTES，只扫描到块内最后一个换行为止，
+    剩余的半行留到下一块开头，从而在完整行上复用 bytes 扫描，不逐行迭代。
+    不含换行的块先暂存在列表里，等读到换行时才拼接一次，
+    超长行（如 sensitive-logs 输出的整段请求体）不会被反复复制和搜索。
+    """
+    collector = _RecordCollector(min_tokens=min_tokens, model_pattern=model_pattern)
+
+    newlines = 0
+    pending: list[bytes] = []  # 尚未遇到换行的半行数据
+    while chunk := stream.read(READ_CHUNK_BYTES):
+        cut = chunk.rfind(b"\n") + 1
+        if not cut:
+            pending.append(chunk)
+            continue
+        if pending:
+            pending.append(chunk)
+            buf = b"".join(pending)
+            cut += len(buf) - len(chunk)
+        else:
+            buf = chunk
+        newlines += _scan_buffer(buf, collector, 0, cut, first_line=newlines + 1)
+        pending = [chunk[cut - len(buf):]] if cut < len(buf) else []
+
+    total_lines = newlines
+    if pending:
+        # 末尾没有换行的最后一行
+        _scan_buffer(b"".join(pending), collector, first_line=newlines + 1)
+        total_lines += 1
+    return collector.result(total_lines)
+
+
+# 并行解析时每个分片的最小字节数，分片过小时进程启动与结果回传的开销会超过收益
+MIN_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def _chunk_bounds(buf: mmap.mmap, jobs: int) -> list[int]:
+    """按字节数把 buf 近似均分为 jobs 段，边界对齐到下一行行首。"""
+    size = len(buf)
+    bounds = [0]
+    for i in range(1, jobs):
+        nl = buf.find(b"\n", max(size * i // jobs, bounds[-1]))
+        if nl < 0:
+            break
+        bounds.append(nl + 1)
+    bounds.append(size)
+    return bounds
+
+
+def _scan_file_range(
+    path: str,
+    start: int,
+    end: int,
+    min_tokens: int,
+    model_pattern: Optional[str],
+) -> tuple[int, tuple[list[Any], ...]]:
+    """子进程入口：解析文件的 [start, end) 字节范围，返回 (换行数, 各类原始记录)。"""
+    collector = _RecordCollector(min_tokens=min_tokens, model_pattern=model_pattern)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        newlines = _scan_buffer(mm, collector, start, end)
+    return newlines, collector.records()
+
+
+def parse_log_file(
+    path: str,
+    *,
+    min_tokens: int = 0,
+    model_pattern: Optional[str] = None,
+    jobs: int = 1,
+) -> ParseResult:
+    """
+    将日志文件 mmap 到内存后按字节扫描（由操作系统按需分页读入）。
+    管道等非普通文件无法 mmap，改为 parse_log_stream 分块读取。
+
+    jobs > 1 时按行边界切分文件，用多个进程并行扫描各分片，
+    再按分片顺序合并记录并把相对行号换算为全局行号。
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            # FIFO、进程替换（<(...)）、/dev/stdin 等不能 mmap，st_size 也恒为 0，按流读取
+            return parse_log_stream(f, min_tokens=min_tokens, model_pattern=model_pattern)
+        if st.st_size == 0:
+            # 空文件无法 mmap
+            return parse_log_buffer(b"", min_tokens=min_tokens, model_pattern=model_pattern)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            jobs = min(jobs, len(mm) // MIN_CHUNK_BYTES)
+            if jobs <= 1:
+                return parse_log_buffer(mm, min_tokens=min_tokens, model_pattern=model_pattern)
+            bounds = _chunk_bounds(mm, jobs)
+            ends_with_newline = mm[-1:] == b"\n"
+
+    collector = _RecordCollector(min_tokens=min_tokens, model_pattern=model_pattern)
+    n = len(bounds) - 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n) as pool:
+        chunks = pool.map(
+            _scan_file_range,
+            [path] * n,
+            bounds[:-1],
+            bounds[1:],
+            [min_tokens] * n,
+            [model_pattern] * n,
+        )
+        line_offset = 0
+        for newlines, records in chunks:
+            collector.extend(records, line_offset)
+            line_offset += newlines
+
+    total_lines = line_offset if ends_with_newline else line_offset + 1
+    return collector.result(total_lines)
 
 
 def _merge_records(
-    requests: list[RequestRecord],
+    requests: list[MergedRequest],
     compressions: list[CompressionRecord],
     context_usages: list[ContextUsageRecord],
 ) -> list[MergedRequest]:
     """
-    关联请求行与压缩统计行。
+    关联请求行与压缩统计行，原地补齐 requests 中的记录并返回该列表。
 
     策略：对每个请求行，在其后 50 行内查找 estimated_input_tokens 相同的压缩统计行。
-    """
-    merged: list[MergedRequest] = []
-    used_comp_indices: set[int] = set()
-    used_ctx_indices: set[int] = set()
-
-    for req in requests:
-        mr = MergedRequest(
-            line_no=req.line_no,
-            timestamp=req.timestamp,
-            model=req.model,
-            max_tokens=req.max_tokens,
-            stream=req.stream,
-            message_count=req.message_count,
-            estimated_input_tokens=req.estimated_input_tokens,
-        )
 
-        # 查找匹配的压缩统计行
-        for ci, comp in enumerate(compressions):
-            if ci in used_comp_indices:
-                continue
-            # 行号邻近（压缩行在请求行之后 50 行内）
-            if not (0 < comp.line_no - req.line_no <= 50):
-                continue
-            # estimated_input_tokens 匹配
-            if comp.estimated_input_tokens != req.estimated_input_tokens:
-                continue
-            # 匹配成功
+    记录都是按行号递增产生的：压缩统计行先按 estimated_input_tokens 分桶成队列，
+    contextUsageEvent 用游标单向扫描。行号不大于当前请求行的记录对之后的请求
+    也不可能匹配，可以直接丢弃，整体为线性复杂度。
+    """
+    comp_index: Dict[int, deque[CompressionRecord]] = defaultdict(deque)
+    for comp in compressions:
+        comp_index[comp.estimated_input_tokens].append(comp)
+    ctx_start = 0
+
+    for mr in requests:
+        # 查找匹配的压缩统计行（estimated_input_tokens 相同，队首即行号最小的未匹配记录）
+        candidates = comp_index.get(mr.estimated_input_tokens)
+        while candidates and candidates[0].line_no <= mr.line_no:
+            candidates.popleft()
+        # 行号邻近（压缩行在请求行之后 50 行内）
+        if candidates and candidates[0].line_no - mr.line_no <= 50:
+            comp = candidates.popleft()
             mr.bytes_saved_total = comp.bytes_saved_total
             mr.whitespace_bytes_saved = comp.whitespace_bytes_saved
             mr.thinking_bytes_saved = comp.thinking_bytes_saved
@@ -362,28 +746,24 @@ def _merge_records(
             mr.history_turns_removed = comp.history_turns_removed
             mr.history_bytes_saved = comp.history_bytes_saved
             mr.has_compression = True
-            used_comp_indices.add(ci)
-            break
 
         # 查找匹配的 contextUsageEvent（在请求行之后 500 行内）
-        for ui, ctx in enumerate(context_usages):
-            if ui in used_ctx_indices:
-                continue
-            if not (0 < ctx.line_no - req.line_no <= 500):
-                continue
-            mr.context_usage_percentage = ctx.context_usage_percentage
-            mr.actual_input_tokens = ctx.actual_input_tokens
-            used_ctx_indices.add(ui)
-            break
+        # 总是取游标处第一条，已匹配的记录都在游标之前，无需额外记录
+        while ctx_start < len(context_usages) and context_usages[ctx_start].line_no <= mr.line_no:
+            ctx_start += 1
+        if ctx_start < len(context_usages):
+            ctx = context_usages[ctx_start]
+            if ctx.line_no - mr.line_no <= 500:
+                mr.context_usage_percentage = ctx.context_usage_percentage
+                mr.actual_input_tokens = ctx.actual_input_tokens
+                ctx_start += 1
 
         # 计算压缩率（基于估算 token 数，假设 1 token ≈ 4 bytes）
         if mr.estimated_input_tokens > 0 and mr.bytes_saved_total > 0:
             estimated_bytes = mr.estimated_input_tokens * 4
             mr.compression_rate = mr.bytes_saved_total / estimated_bytes * 100
 
-        merged.append(mr)
-
-    return merged
+    return requests
 
 
 # ---------------------------------------------------------------------------
@@ -391,10 +771,88 @@ def _merge_records(
 # ---------------------------------------------------------------------------
 
 
-def median(values: list[float]) -> float:
+# 压缩管道各层：(报告标签, JSON 键, MergedRequest 字段)
+LAYERS = (
+    ("空白压缩:", "whitespace", "whitespace_bytes_saved"),
+    ("thinking 截断:", "thinking", "thinking_bytes_saved"),
+    ("tool_result:", "tool_result", "tool_result_bytes_saved"),
+    ("tool_use_input:", "tool_use_input", "tool_use_input_bytes_saved"),
+    ("历史截断:", "history", "history_bytes_saved"),
+)
+
+
+@dataclass(slots=True)
+class HourlyStats:
+    """按小时累加的趋势统计。"""
+    requests: int = 0
+    bytes_saved: int = 0
+    context_usage_sum: float = 0
+    context_usage_count: int = 0
+
+
+@dataclass(slots=True)
+class CompressionSummary:
+    """有压缩统计的请求的汇总值。"""
+    total_saved: int = 0
+    # JSON 键 -> 该层节省字节总数，顺序同 LAYERS
+    layer_totals: Dict[str, int] = field(default_factory=dict)
+    history_requests: int = 0
+    history_turns_total: int = 0
+    history_turns_max: int = 0
+    # 升序排列，可直接以 presorted=True 传给 median
+    rates: list[float] = field(default_factory=list)
+    # 小时桶（2025-01-15T10）-> 趋势统计
+    hourly: Dict[str, HourlyStats] = field(default_factory=dict)
+
+
+def sum_layer_totals(with_comp: list[MergedRequest]) -> tuple[int, Dict[str, int]]:
+    """返回 (总节省字节数, 各层节省字节数)；JSON 报告只需要这部分汇总。"""
+    # 纯求和的列用 sum(map(attrgetter)) 逐列归约，整个循环都在 C 层完成
+    total = sum(map(attrgetter("bytes_saved_total"), with_comp))
+    layer_totals = {key: sum(map(attrgetter(attr), with_comp)) for _, key, attr in LAYERS}
+    return total, layer_totals
+
+
+def summarize_compression(with_comp: list[MergedRequest]) -> CompressionSummary:
+    """汇总有压缩统计的请求。"""
+    total, layer_totals = sum_layer_totals(with_comp)
+
+    # 带条件的统计仍需一次 Python 层遍历，小时趋势也在同一遍里累加
+    hist_reqs = hist_turns = hist_max = 0
+    rates: list[float] = []
+    hourly: Dict[str, HourlyStats] = defaultdict(HourlyStats)
+    for r in with_comp:
+        if r.history_turns_removed > 0:
+            hist_reqs += 1
+            hist_turns += r.history_turns_removed
+            if r.history_turns_removed > hist_max:
+                hist_max = r.history_turns_removed
+        if r.compression_rate > 0:
+            rates.append(r.compression_rate)
+        if r.timestamp:
+            h = hourly[hour_bucket(r.timestamp)]
+            h.requests += 1
+            h.bytes_saved += r.bytes_saved_total
+            if r.context_usage_percentage is not None:
+                h.context_usage_sum += r.context_usage_percentage
+                h.context_usage_count += 1
+    rates.sort()
+    return CompressionSummary(
+        total_saved=total,
+        layer_totals=layer_totals,
+        history_requests=hist_reqs,
+        history_turns_total=hist_turns,
+        history_turns_max=hist_max,
+        rates=rates,
+        hourly=dict(hourly),
+    )
+
+
+def median(values: list[float], *, presorted: bool = False) -> float:
+    """中位数；presorted=True 表示 values 已升序排列，可跳过排序。"""
     if not values:
         return 0.0
-    s = sorted(values)
+    s = values if presorted else sorted(values)
     n = len(s)
     if n % 2 == 1:
         return s[n // 2]
@@ -450,11 +908,12 @@ def generate_report(
         w("未找到压缩统计数据。")
         return "\n".join(lines)
 
+    summary = summarize_compression(with_comp)
+
     # --- 总体概览 ---
-    total_saved = sum(r.bytes_saved_total for r in with_comp)
+    total_saved = summary.total_saved
     avg_saved = total_saved // len(with_comp) if with_comp else 0
-    rates = [r.compression_rate for r in with_comp if r.compression_rate > 0]
-    median_rate = median(rates)
+    median_rate = median(summary.rates, presorted=True)
 
     w("--- 总体概览 ---")
     w(f"总节省字节: {fmt_bytes(total_saved)}")
@@ -463,33 +922,23 @@ def generate_report(
     w("")
 
     # --- 各层贡献 ---
-    ws_total = sum(r.whitespace_bytes_saved for r in with_comp)
-    th_total = sum(r.thinking_bytes_saved for r in with_comp)
-    tr_total = sum(r.tool_result_bytes_saved for r in with_comp)
-    tu_total = sum(r.tool_use_input_bytes_saved for r in with_comp)
-    hi_total = sum(r.history_bytes_saved for r in with_comp)
-
     def layer_line(name: str, val: int) -> str:
         pct = val / total_saved * 100 if total_saved > 0 else 0
         avg = val // len(with_comp) if with_comp else 0
         return f"  {name:<18}{val:>12,} bytes ({pct:>5.1f}%)  avg {avg:,}/req"
 
     w("--- 各层贡献 ---")
-    w(layer_line("空白压缩:", ws_total))
-    w(layer_line("thinking 截断:", th_total))
-    w(layer_line("tool_result:", tr_total))
-    w(layer_line("tool_use_input:", tu_total))
-    w(layer_line("历史截断:", hi_total))
+    for label, key, _ in LAYERS:
+        w(layer_line(label, summary.layer_totals[key]))
     w("")
 
     # --- 历史截断详情 ---
-    with_history = [r for r in with_comp if r.history_turns_removed > 0]
+    hist_n = summary.history_requests
     w("--- 历史截断详情 ---")
-    w(f"触发历史截断的请求: {len(with_history)}/{len(with_comp)} ({len(with_history)/len(with_comp)*100:.1f}%)")
-    if with_history:
-        turns = [r.history_turns_removed for r in with_history]
-        w(f"平均移除轮数: {sum(turns)/len(turns):.1f}")
-        w(f"最大移除轮数: {max(turns)}")
+    w(f"触发历史截断的请求: {hist_n}/{len(with_comp)} ({hist_n/len(with_comp)*100:.1f}%)")
+    if hist_n:
+        w(f"平均移除轮数: {summary.history_turns_total/hist_n:.1f}")
+        w(f"最大移除轮数: {summary.history_turns_max}")
     w("")
 
     # --- 上下文窗口使用 ---
@@ -564,20 +1013,17 @@ def generate_report(
     w("")
 
     # --- 时间趋势 ---
-    hourly: Dict[str, list[MergedRequest]] = defaultdict(list)
-    for r in with_comp:
-        if r.timestamp:
-            hourly[hour_bucket(r.timestamp)].append(r)
-
+    hourly = summary.hourly
     if hourly:
         w("--- 时间趋势 (按小时) ---")
         for hour in sorted(hourly.keys()):
-            reqs = hourly[hour]
-            avg_s = sum(r.bytes_saved_total for r in reqs) // len(reqs)
-            ctx_reqs = [r for r in reqs if r.context_usage_percentage is not None]
-            avg_ctx = sum(r.context_usage_percentage for r in ctx_reqs) / len(ctx_reqs) if ctx_reqs else 0
-            ctx_str = f"  avg_context_usage={avg_ctx:.1f}%" if ctx_reqs else ""
-            w(f"  {hour}:  requests={len(reqs)}  avg_saved={avg_s:,}{ctx_str}")
+            h = hourly[hour]
+            avg_s = h.bytes_saved // h.requests
+            ctx_str = ""
+            if h.context_usage_count:
+                avg_ctx = h.context_usage_sum / h.context_usage_count
+                ctx_str = f"  avg_context_usage={avg_ctx:.1f}%"
+            w(f"  {hour}:  requests={h.requests}  avg_saved={avg_s:,}{ctx_str}")
         w("")
 
     return "\n".join(lines)
@@ -592,7 +1038,7 @@ def generate_json_report(
 ) -> str:
     """生成 JSON 格式的汇总报告。"""
     with_comp = [r for r in merged if r.has_compression]
-    total_saved = sum(r.bytes_saved_total for r in with_comp)
+    total_saved, layer_totals = sum_layer_totals(with_comp)
 
     report = {
         "total_lines": total_lines,
@@ -600,13 +1046,7 @@ def generate_json_report(
         "with_compression": len(with_comp),
         "total_bytes_saved": total_saved,
         "avg_bytes_saved": total_saved // len(with_comp) if with_comp else 0,
-        "layers": {
-            "whitespace": sum(r.whitespace_bytes_saved for r in with_comp),
-            "thinking": sum(r.thinking_bytes_saved for r in with_comp),
-            "tool_result": sum(r.tool_result_bytes_saved for r in with_comp),
-            "tool_use_input": sum(r.tool_use_input_bytes_saved for r in with_comp),
-            "history": sum(r.history_bytes_saved for r in with_comp),
-        },
+        "layers": layer_totals,
         "rejections": len(rejections),
         "adaptive_shrinks": len(adaptive_shrinks),
         "local_rejects": len(local_rejects),
@@ -624,13 +1064,12 @@ def write_csv(merged: list[MergedRequest], path: str) -> None:
         "history_turns_removed", "history_bytes_saved",
         "compression_rate", "context_usage_percentage", "actual_input_tokens",
     ]
+    # attrgetter 一次取出整行字段元组，避免逐行 asdict 深拷贝再投影
+    row_of = attrgetter(*fieldnames)
     with open(path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for r in merged:
-            row = asdict(r)
-            row = {k: row[k] for k in fieldnames}
-            writer.writerow(row)
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        writer.writerows(map(row_of, merged))
 
 
 # ---------------------------------------------------------------------------
@@ -653,26 +1092,31 @@ def main(argv: list[str]) -> int:
     parser.add_argument("--json", action="store_true", help="JSON 格式输出汇总")
     parser.add_argument("--min-tokens", type=int, default=0, help="仅分析 estimated_input_tokens >= N 的请求")
     parser.add_argument("--model", metavar="PATTERN", help="按模型名过滤（正则）")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1,
+        help="并行解析的进程数，仅对日志文件生效，小文件自动退化为单进程（默认: 1）"
+    )
     args = parser.parse_args(argv)
 
-    # 读取日志
+    # 读取并解析日志：stdin 按块流式读取；文件 mmap 后按字节扫描，均不整体载入内存
     if args.logfile == "-":
-        log_lines = sys.stdin.read().splitlines()
+        merged, rejections, adaptive_shrinks, local_rejects, total_lines = parse_log_stream(
+            sys.stdin.buffer,
+            min_tokens=args.min_tokens,
+            model_pattern=args.model,
+        )
     else:
         try:
-            with open(args.logfile, "r", encoding="utf-8", errors="replace") as f:
-                log_lines = f.read().splitlines()
+            merged, rejections, adaptive_shrinks, local_rejects, total_lines = parse_log_file(
+                args.logfile,
+                min_tokens=args.min_tokens,
+                model_pattern=args.model,
+                jobs=args.jobs,
+            )
         except FileNotFoundError:
             print(f"ERROR: 日志文件不存在: {args.logfile}", file=sys.stderr)
             return 2
 
-    # 解析
-    merged, rejections, adaptive_shrinks, local_rejects, total_lines = parse_log(
-        log_lines,
-        min_tokens=args.min_tokens,
-        model_pattern=args.model,
-    )
-
     # 输出
     if args.json:
         print(generate_json_report(merged, rejections, adaptive_shrinks, local_rejects, total_lines))
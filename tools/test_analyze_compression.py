@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""analyze_compression.py 字段提取的回归测试（无需启动服务）"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import analyze_compression as ac
+
+def test_missing_trailing_key_long_line():
+    """前面的字段反复出现、缺少最后几个字段的长行，提取应在线性时间内完成并回退到 parse_kv"""
+    print("测试: 缺少尾部字段的长压缩统计行")
+    segment = (
+        "estimated_input_tokens=1 bytes_saved_total=2 whitespace_bytes_saved=3 "
+        "thinking_bytes_saved=4 tool_result_bytes_saved=5 tool_use_input_bytes_saved=6 "
+    )
+    # 约 60 KB，旧的单条 .*? 正则在 4 KB 左右就需要数秒
+    line = f"2025-01-15T10:23:45 INFO {ac.MARKER_COMPRESSION} " + segment * 400
+
+    start = time.perf_counter()
+    fields = ac.extract_compression_fields(line)
+    elapsed = time.perf_counter() - start
+
+    print(f"行长度: {len(line)}，耗时: {elapsed:.4f}s")
+    assert fields == ("1", "2", "3", "4", "5", "6", "0", "0"), f"字段提取结果错误: {fields}"
+    assert elapsed < 0.5, "字段提取耗时异常，正则可能出现回溯"
+    print("✓ 测试通过\n")
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("analyze_compression 回归测试")
+    print("=" * 60 + "\n")
+
+    try:
+        test_missing_trailing_key_long_line()
+        print("=" * 60)
+        print("所有测试通过！")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
@@ -2,127 +2,136 @@
 """测试空消息内容和 prefill 处理的改进"""
 
 import json
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，缺失时回退到标准库 json
+    orjson = None
 
 BASE_URL = "http://localhost:8080"
 API_KEY = "test-key"
 
-def safe_print_response(response):
+# 所有用例共用一个 Session，并发请求时连接池最多保持 4 条 keep-alive 连接
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+SESSION.headers.update({
+    "x-api-key": API_KEY,
+    "anthropic-version": "2023-06-01",
+    "content-type": "application/json",
+})
+
+def safe_print_response(response, emit=print):
     """安全打印响应，处理非 JSON 情况"""
     try:
-        data = response.json()
-        print(f"响应: {json.dumps(data, indent=2, ensure_ascii=False)}")
+        if orjson is not None:
+            data = orjson.loads(response.content)
+            text = orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+        else:
+            data = response.json()
+            text = json.dumps(data, indent=2, ensure_ascii=False)
+        emit(f"响应: {text}")
         return data
     except (json.JSONDecodeError, ValueError):
-        print(f"响应 (非 JSON): {response.text}")
+        emit(f"响应 (非 JSON): {response.text}")
         return None
 
-def test_empty_content():
-    """测试空消息内容应返回 400 错误"""
-    print("测试 1: 空消息内容")
-    response = requests.post(
-        f"{BASE_URL}/v1/messages",
-        headers={
-            "x-api-key": API_KEY,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json",
-        },
-        json={
-            "model": "claude-sonnet-4",
-            "max_tokens": 1024,
-            "messages": [
-                {"role": "user", "content": ""}
-            ]
-        }
-    )
-    print(f"状态码: {response.status_code}")
-    data = safe_print_response(response)
+def post_messages(payload):
+    """向 /v1/messages 发送请求"""
+    return SESSION.post(f"{BASE_URL}/v1/messages", json=payload)
+
+def check_empty_rejected(response, emit=print):
+    """空内容请求应返回 400 错误，且错误消息包含'消息内容为空'"""
+    emit(f"状态码: {response.status_code}")
+    data = safe_print_response(response, emit)
     assert response.status_code == 400, "应返回 400 错误"
     if data:
         assert "消息内容为空" in data.get("error", {}).get("message", ""), "错误消息应包含'消息内容为空'"
-    print("✓ 测试通过\n")
+    emit("✓ 测试通过\n")
+
+# 各测试的 emit 参数用于输出：默认直接打印；并发运行时传入收集函数，
+# 由 run_cases 在全部完成后按顺序统一打印，避免多个线程的输出交错
+
+def test_empty_content(emit=print):
+    """测试空消息内容应返回 400 错误"""
+    emit("测试 1: 空消息内容")
+    response = post_messages({
+        "model": "claude-sonnet-4",
+        "max_tokens": 1024,
+        "messages": [
+            {"role": "user", "content": ""}
+        ]
+    })
+    check_empty_rejected(response, emit)
 
-def test_empty_text_blocks():
+def test_empty_text_blocks(emit=print):
     """测试仅包含空白文本块的消息"""
-    print("测试 2: 仅包含空白文本块")
-    response = requests.post(
-        f"{BASE_URL}/v1/messages",
-        headers={
-            "x-api-key": API_KEY,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json",
-        },
-        json={
-            "model": "claude-sonnet-4",
-            "max_tokens": 1024,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "   "},
-                        {"type": "text", "text": "\n\t"}
-                    ]
-                }
-            ]
-        }
-    )
-    print(f"状态码: {response.status_code}")
-    data = safe_print_response(response)
-    assert response.status_code == 400, "应返回 400 错误"
-    if data:
-        assert "消息内容为空" in data.get("error", {}).get("message", ""), "错误消息应包含'消息内容为空'"
-    print("✓ 测试通过\n")
+    emit("测试 2: 仅包含空白文本块")
+    response = post_messages({
+        "model": "claude-sonnet-4",
+        "max_tokens": 1024,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "   "},
+                    {"type": "text", "text": "\n\t"}
+                ]
+            }
+        ]
+    })
+    check_empty_rejected(response, emit)
 
-def test_prefill_with_empty_user():
+def test_prefill_with_empty_user(emit=print):
     """测试 prefill 场景下空 user 消息"""
-    print("测试 3: Prefill 场景下空 user 消息")
-    response = requests.post(
-        f"{BASE_URL}/v1/messages",
-        headers={
-            "x-api-key": API_KEY,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json",
-        },
-        json={
-            "model": "claude-sonnet-4",
-            "max_tokens": 1024,
-            "messages": [
-                {"role": "user", "content": ""},
-                {"role": "assistant", "content": "Hi there"}
-            ]
-        }
-    )
-    print(f"状态码: {response.status_code}")
-    data = safe_print_response(response)
-    assert response.status_code == 400, "应返回 400 错误"
-    if data:
-        assert "消息内容为空" in data.get("error", {}).get("message", ""), "错误消息应包含'消息内容为空'"
-    print("✓ 测试通过\n")
+    emit("测试 3: Prefill 场景下空 user 消息")
+    response = post_messages({
+        "model": "claude-sonnet-4",
+        "max_tokens": 1024,
+        "messages": [
+            {"role": "user", "content": ""},
+            {"role": "assistant", "content": "Hi there"}
+        ]
+    })
+    check_empty_rejected(response, emit)
 
-def test_valid_message():
+def test_valid_message(emit=print):
     """测试正常消息应该成功"""
-    print("测试 4: 正常消息（对照组）")
-    response = requests.post(
-        f"{BASE_URL}/v1/messages",
-        headers={
-            "x-api-key": API_KEY,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json",
-        },
-        json={
-            "model": "claude-sonnet-4",
-            "max_tokens": 50,
-            "messages": [
-                {"role": "user", "content": "Say 'test' only"}
-            ]
-        }
-    )
-    print(f"状态码: {response.status_code}")
+    emit("测试 4: 正常消息（对照组）")
+    response = post_messages({
+        "model": "claude-sonnet-4",
+        "max_tokens": 50,
+        "messages": [
+            {"role": "user", "content": "Say 'test' only"}
+        ]
+    })
+    emit(f"状态码: {response.status_code}")
     if response.status_code == 200:
-        print("✓ 测试通过：正常消息处理成功\n")
+        emit("✓ 测试通过：正常消息处理成功\n")
     else:
-        safe_print_response(response)
-        print()
+        safe_print_response(response, emit)
+        emit("")
+
+TESTS = (
+    test_empty_content,
+    test_empty_text_blocks,
+    test_prefill_with_empty_user,
+    test_valid_message,
+)
+
+def run_cases():
+    """并发运行所有测试，全部完成后按提交顺序打印全部输出，再抛出第一个失败"""
+    outputs = [[] for _ in TESTS]
+    with ThreadPoolExecutor(max_workers=len(TESTS)) as executor:
+        futures = [executor.submit(test, out.append) for test, out in zip(TESTS, outputs)]
+    for out in outputs:
+        for text in out:
+            print(text)
+    for future in futures:
+        future.result()
 
 if __name__ == "__main__":
     print("=" * 60)
@@ -130,10 +139,7 @@ if __name__ == "__main__":
     print("=" * 60 + "\n")
 
     try:
-        test_empty_content()
-        test_empty_text_blocks()
-        test_prefill_with_empty_user()
-        test_valid_message()
+        run_cases()
         print("=" * 60)
         print("所有测试通过！")
         print("=" * 60)